@@ -0,0 +1,200 @@
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tictactoe import Board, O, X
+
+
+# Square permutations of each board symmetry, in the same order as Board.symmetries.
+# A symmetric board satisfies s.board[j] == board.board[SYMMETRIES[k][j]]
+SYMMETRIES = [s.board for s in Board(range(9)).symmetries()]
+
+# Squares (and separators) are stored as ascii bytes in the game logs
+SEPARATORS = b' ,;\t\r'
+ZERO = ord('0')
+
+
+class MoveFrequencies:
+    """Move counts per canonical position, aggregated from a dataset of games.
+
+    Rows are indexed by `hash(board)`, just like the engine evaluations, and
+    columns by the square that was played, in the orientation of the canonical
+    board (the symmetry with the lowest base-3 value). Squares that are equivalent
+    under a symmetry of the canonical board are all counted in the lowest one.
+    """
+
+    def __init__(self, counts=None):
+        if counts is None:
+            counts = np.zeros((3 ** 9, 9), dtype=np.int64)
+        self.counts = counts
+
+    def __getitem__(self, board):
+        # Return move counts in the orientation of the given board. Equivalent
+        # squares split the counts of their canonical square evenly, so that the
+        # counts add up to the number of times the position was seen
+        canon, squares, _ = canonical_moves(board_value(board.board))
+        empty = [squares[square] for square in range(9) if board.board[square] == 0]
+
+        counts = np.zeros(9)
+        for square in range(9):
+            if board.board[square] == 0:
+                counts[square] = self.counts[canon, squares[square]] / empty.count(squares[square])
+        return counts
+
+    def probabilities(self, board):
+        # Empirical probability of each square being played in the given board
+        total = self.counts[hash(board)].sum()
+        if not total:
+            return np.full(9, np.nan)
+        return self[board] / total
+
+    @property
+    def ngames(self):
+        return int(self.counts[0].sum())
+
+    def save(self, path):
+        np.save(path, self.counts)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+
+def board_value(board):
+    # Base 3 value of a board, as used by Board.__hash__
+    value = 0
+    for i, item in enumerate(board):
+        value += item * 3 ** i
+    return value
+
+
+_canonical_cache = {}
+
+
+def canonical_moves(value):
+    """Return the canonical hash of the board with the given base-3 value, together
+    with the canonical square of each of its squares and whether the game is over.
+    """
+    if value in _canonical_cache:
+        return _canonical_cache[value]
+
+    board = Board(value // 3 ** i % 3 for i in range(9))
+    symm_values = [board_value(s.board) for s in board.symmetries()]
+    canon = min(symm_values)
+
+    # If the canonical board is itself symmetric, more than one symmetry maps to it,
+    # and each maps a square to a different member of its orbit. Pick the lowest one.
+    squares = []
+    for square in range(9):
+        squares.append(min(
+            perm.index(square)
+            for perm, symm_value in zip(SYMMETRIES, symm_values)
+            if symm_value == canon
+        ))
+
+    result = canon, tuple(squares), board.game_over()
+    _canonical_cache[value] = result
+    return result
+
+
+def count_chunk(path, start, end, buffer_size=2 ** 20):
+    """Aggregate move counts of the games between byte offsets start and end of path.
+
+    Returns a flat array of size 3**9 * 9 with the counts of each
+    (canonical position, canonical square) pair. Moves are buffered and added
+    to the counts every buffer_size moves to keep memory bounded.
+    """
+    powers = [3 ** i for i in range(9)]
+    counts = np.zeros(3 ** 9 * 9, dtype=np.int64)
+    indices = []
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            line_end = mm.find(b'\n', pos, end)
+            if line_end == -1:
+                line_end = end
+            line = mm[pos:line_end].translate(None, SEPARATORS)
+            pos = line_end + 1
+
+            if not line or line.startswith(b'#'):
+                continue
+
+            value = 0
+            player = X
+            for char in line:
+                square = char - ZERO
+                if not 0 <= square < 9 or value // powers[square] % 3:
+                    raise ValueError(f'Illegal move {chr(char)!r} in game {line.decode()!r}')
+
+                canon, squares, game_over = canonical_moves(value)
+                if game_over:
+                    raise ValueError(f'Move after game over in game {line.decode()!r}')
+
+                indices.append(canon * 9 + squares[square])
+                value += player * powers[square]
+                player = O if player == X else X
+
+            if len(indices) >= buffer_size:
+                counts += np.bincount(indices, minlength=3 ** 9 * 9)
+                indices = []
+
+    if indices:
+        counts += np.bincount(indices, minlength=3 ** 9 * 9)
+    return counts
+
+
+def split_chunks(path, chunk_size):
+    # Split file in (start, end) byte offsets of roughly chunk_size, aligned to line ends
+    size = os.path.getsize(path)
+    if not size:
+        return []
+
+    chunks = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = mm.find(b'\n', min(start + chunk_size, size - 1))
+            end = size if end == -1 else end + 1
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def ingest(path, workers=None, chunk_size=64 * 2 ** 20):
+    """Count moves per canonical position in a file of games.
+
+    Each line of the file holds one game, as the sequence of squares (0-8, row major)
+    played alternately by X and O, e.g. `40812`. Spaces and commas between squares
+    are ignored, as are empty lines and lines starting with `#`.
+
+    The file is split in chunks of about chunk_size bytes, which are processed
+    in parallel by a pool of worker processes.
+    """
+    chunks = split_chunks(path, chunk_size)
+    counts = np.zeros(3 ** 9 * 9, dtype=np.int64)
+
+    if workers == 1 or len(chunks) <= 1:
+        for start, end in chunks:
+            counts += count_chunk(path, start, end)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(count_chunk, path, start, end) for start, end in chunks]
+            for future in futures:
+                counts += future.result()
+
+    return MoveFrequencies(counts.reshape(3 ** 9, 9))
+
+
+if __name__ == '__main__':
+    import sys
+
+    freqs = ingest(sys.argv[1])
+    print('Games:', freqs.ngames)
+
+    for board in (Board(), Board((X, 0, 0, 0, 0, 0, 0, 0, 0)), Board((0, 0, 0, 0, X, 0, 0, 0, 0))):
+        print('')
+        print(board)
+        print(freqs.probabilities(board).reshape(3, 3).round(3))
@@ -3,23 +3,36 @@ from tictactoe import Board, O, X
 
 class MiniMax:
 
-    def __init__(self):
+    def __init__(self, tablebase=None):
         self.board_evals = {}
         # self.search()
         self.hits = 0
 
+        # Optional Tablebase used as leaf oracle
+        self.tablebase = tablebase
+        self.tablebase_hits = 0
+
     def __getitem__(self, board):
         return self.board_evals[hash(board)]
 
-    def search(self, board: Board=None):
-        if board is None:
-            board = Board()
-
+    def _search(self, board: Board, probe=True):
         board_hash = hash(board)
         if board_hash in self.board_evals:
-            self.hits += 1
             bestmove, bestscore, *_ = self.board_evals[board_hash].values()
-            return bestscore
+            # Tablebase entries have no bestmove, so they are searched again at the root
+            if probe or bestmove is not None or board.game_over():
+                self.hits += 1
+                return bestscore
+
+        if probe and self.tablebase is not None:
+            score = self.tablebase.score(board)
+            if score is not None:
+                self.tablebase_hits += 1
+                self.board_evals[board_hash] = {
+                    'bestmove': None, 'bestscore': score,
+                    'moves': [], 'scores': [],
+                }
+                return score
 
         if board.game_over():
             winner = board.winner()
@@ -39,7 +52,7 @@ class MiniMax:
         moves = []
         scores = []
         for move in board.generate_unique_legal_moves():
-            score = -self.search(move)
+            score = -self._search(move)
             if score > bestscore:
                 bestscore = score
                 bestmove = move
@@ -52,6 +65,13 @@ class MiniMax:
         }
         return bestscore
 
+    def search(self, board: Board=None):
+        if board is None:
+            board = Board()
+
+        # The tablebase is only probed below the root, so that it always gets a bestmove
+        return self._search(board, probe=False)
+
 
 if __name__ == '__main__':
 
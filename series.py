@@ -0,0 +1,229 @@
+from tictactoe import Board, O, X
+from minimax import MiniMax
+from expectiminimax import ExpectiMiniMax
+
+
+class SeriesPlanner:
+    """Plan the moves of X over a series of games against an opponent O that is
+    either optimal or random, maximizing the expected total payoff.
+
+    The posterior probability that O is optimal is updated after each of its
+    moves: an optimal O plays uniformly among the moves with the best MiniMax
+    score, and a random O uniformly among all legal moves. Posteriors are rounded
+    to a grid of step resolution, so that evaluations can be cached by
+    (grid posterior, board, games remaining). Only certain posteriors are rounded
+    to 0 or 1. Scores are in the MiniMax units, from the point of view of X.
+    """
+
+    def __init__(self, resolution=0.01):
+        self.resolution = resolution
+        self.nkeys = round(1 / resolution)
+        self.board_evals = {}
+        self.next_keys = {}
+        self.hits = 0
+
+        self.minimax = MiniMax()
+        self.minimax.search()
+        self.expectiminimax = ExpectiMiniMax()
+        self.expectiminimax.search()
+
+    def __getitem__(self, item):
+        posterior, board, ngames = item
+        return self.board_evals[(self._discretize(posterior), hash(board), ngames)]
+
+    def _discretize(self, posterior):
+        # Only certain posteriors are mapped to the end points of the grid
+        key = round(posterior * self.nkeys)
+        if 0 < posterior < 1:
+            key = min(max(key, 1), self.nkeys - 1)
+        return key
+
+    def _minimax_score(self, board):
+        evals = self.minimax[board]
+        return evals.get('bestscore', evals.get('score'))
+
+    def _opponent_moves(self, board, posterior_key):
+        # Return (move, probability, posterior key after move) for each legal move of O
+        posterior = posterior_key / self.nkeys
+        legal_moves = board.generate_legal_moves()
+        move_scores = [self._minimax_score(move) for move in legal_moves]
+        # Move scores are from the point of view of X, so the best ones for O are the lowest
+        best_moves = [score == min(move_scores) for score in move_scores]
+
+        # Likelihood of each move under the optimal and the random model
+        optimal_lik = 1 / sum(best_moves)
+        random_lik = 1 / len(legal_moves)
+
+        result = []
+        for move, best in zip(legal_moves, best_moves):
+            move_optimal_prob = posterior * optimal_lik * best
+            move_prob = move_optimal_prob + (1 - posterior) * random_lik
+            result.append((move, move_prob, self._discretize(move_optimal_prob / move_prob)))
+        return result
+
+    def _next_keys(self, posterior_key, board=None):
+        # Posterior keys at the end of a game played from board with posterior_key
+        if board is None:
+            if posterior_key in self.next_keys:
+                return self.next_keys[posterior_key]
+            self.next_keys[posterior_key] = self._next_keys(posterior_key, Board())
+            return self.next_keys[posterior_key]
+
+        next_keys = set()
+        visited = set()
+        stack = [(posterior_key, board)]
+        while stack:
+            key, board = stack.pop()
+            if (key, hash(board)) in visited:
+                continue
+            visited.add((key, hash(board)))
+
+            if board.game_over():
+                next_keys.add(key)
+            elif key in (0, self.nkeys):
+                # Certain posteriors are evaluated without searching the next games
+                continue
+            elif board.side_to_move() == X:
+                stack.extend((key, move) for move in board.generate_unique_legal_moves())
+            else:
+                for move, _, move_key in self._opponent_moves(board, key):
+                    stack.append((move_key, move))
+
+        return next_keys
+
+    def _search(self, board, posterior_key, ngames):
+        key = (posterior_key, hash(board), ngames)
+        if key in self.board_evals:
+            self.hits += 1
+            return self.board_evals[key]['score']
+
+        side_to_move = board.side_to_move()
+
+        if board.game_over():
+            winner = board.winner()
+            if not winner:
+                score = 0
+            else:
+                nmoves = sum(bool(sq) for sq in board.board)
+                score = 10 - nmoves if winner == X else -10 + nmoves
+
+            # Next game values are filled in by search before they are needed
+            if ngames > 1:
+                score += self.board_evals[(posterior_key, hash(Board()), ngames - 1)]['score']
+
+            self.board_evals[key] = {
+                'bestmove': None, 'score': score,
+                'moves': [], 'scores': [],
+            }
+            return score
+
+        # O is known to be random or optimal, and will remain so for the rest of the series
+        if posterior_key in (0, self.nkeys):
+            if posterior_key:
+                score = self._minimax_score(board)
+                series_score = self.minimax.search(Board())
+            else:
+                score = self.expectiminimax[(X, board)]['score']
+                series_score = self.expectiminimax.search(Board())
+            if side_to_move == O:
+                score = -score
+
+            score += (ngames - 1) * series_score
+            self.board_evals[key] = {
+                'bestmove': None, 'score': score,
+                'moves': [], 'scores': [],
+            }
+            return score
+
+        moves = []
+        scores = []
+
+        # X turn
+        if side_to_move == X:
+            bestscore = -999
+            bestmove = None
+            for move in board.generate_unique_legal_moves():
+                moves.append(move)
+                score = self._search(move, posterior_key, ngames)
+                if score > bestscore:
+                    bestscore = score
+                    bestmove = move
+                scores.append(score)
+
+            self.board_evals[key] = {
+                'bestmove': bestmove, 'score': bestscore,
+                'moves': moves, 'scores': scores,
+            }
+            return bestscore
+
+        # O turn, averaged over the mixture of opponent models
+        avg_score = 0
+        scores_hash = {}
+        for move, move_prob, move_key in self._opponent_moves(board, posterior_key):
+            moves.append(move)
+            move_hash = hash(move)
+
+            # If equivalent move was already computed simply add it to the scores list
+            if move_hash in scores_hash:
+                score = scores_hash[move_hash]
+            else:
+                score = self._search(move, move_key, ngames)
+                scores_hash[move_hash] = score
+
+            scores.append(score)
+            avg_score += move_prob * score
+
+        self.board_evals[key] = {
+            'bestmove': None, 'score': avg_score,
+            'moves': moves, 'scores': scores,
+        }
+        return avg_score
+
+    def search(self, prior, ngames, board: Board = None):
+        """Expected total payoff for X over ngames (including the current one),
+        given the prior probability that O is optimal.
+        """
+        if board is None:
+            board = Board()
+
+        # Build the series from the last game, so that the recursion depth does not grow
+        # with ngames: the root of each game is filled in for every posterior it can be
+        # reached with before the games leading to it are searched
+        root_keys = []
+        if ngames > 1:
+            root_keys.append(self._next_keys(self._discretize(prior), board))
+        for _ in range(ngames - 2):
+            root_keys.append(set().union(*(self._next_keys(key) for key in root_keys[-1])))
+
+        for n, keys in enumerate(reversed(root_keys), start=1):
+            for posterior_key in keys:
+                self._search(Board(), posterior_key, n)
+
+        return self._search(board, self._discretize(prior), ngames)
+
+
+if __name__ == '__main__':
+
+    planner = SeriesPlanner()
+
+    b = Board()
+    prior = 0.5
+
+    for ngames in (1, 2, 5, 10):
+        print(f'{ngames=}: {planner.search(prior, ngames, b):.3f}')
+    print(len(planner.board_evals))
+    print(planner.hits)
+
+    # Evaluations do not depend on what was searched before
+    assert planner.search(0.3, 10) == SeriesPlanner().search(0.3, 10)
+
+    # Compare first moves of X in a single game and at the start of a series
+    for ngames in (1, 10):
+        print('')
+        print('#'*20)
+        print(f'{ngames=}')
+        *_, moves, scores = planner[(prior, b, ngames)].values()
+        for move, score in zip(moves, scores):
+            print('')
+            print(f'{score=:.3f}')
+            print(move)
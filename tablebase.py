@@ -0,0 +1,253 @@
+import zlib
+from math import comb
+
+import numpy as np
+
+from tictactoe import Board, O, X
+
+
+# 2-bit WDL codes, from the point of view of the side to move
+LOSS = 1
+DRAW = 2
+WIN = 3
+
+# Number of rank slots per precomputed popcount of the position bitmaps
+SUPERBLOCK = 512
+
+
+def layer_size(nsquares, npieces):
+    # Number of boards with npieces, of which X has ceil(npieces / 2)
+    nx = (npieces + 1) // 2
+    return comb(nsquares, npieces) * comb(npieces, nx)
+
+
+def rank_combination(items):
+    # Rank of a sorted combination in colexicographic order
+    return sum(comb(item, k + 1) for k, item in enumerate(items))
+
+
+def unrank_combination(rank, k):
+    # Inverse of rank_combination for combinations of size k
+    items = []
+    for k in range(k, 0, -1):
+        item = k - 1
+        while comb(item + 1, k) <= rank:
+            item += 1
+        rank -= comb(item, k)
+        items.append(item)
+    return items[::-1]
+
+
+def rank(board):
+    """Rank of a board among all boards with the same number of pieces.
+
+    Boards are ranked by the combination of occupied squares, and then by
+    which of the occupied squares belong to X.
+    """
+    occupied = [square for square, item in enumerate(board) if item]
+    xs = [k for k, square in enumerate(occupied) if board[square] == X]
+    return rank_combination(occupied) * comb(len(occupied), len(xs)) + rank_combination(xs)
+
+
+def unrank(index, nsquares, npieces):
+    # Inverse of rank
+    nx = (npieces + 1) // 2
+    occupied_rank, xs_rank = divmod(index, comb(npieces, nx))
+    occupied = unrank_combination(occupied_rank, npieces)
+    xs = set(unrank_combination(xs_rank, nx))
+
+    board = [0] * nsquares
+    for k, square in enumerate(occupied):
+        board[square] = X if k in xs else O
+    return tuple(board)
+
+
+def canonical(board):
+    # Canonical board among the symmetries of board, as used by Board.__hash__
+    value = hash(board)
+    return tuple(value // 3 ** i % 3 for i in range(len(board.board)))
+
+
+def pack(codes):
+    # Pack 2-bit codes, 4 per byte
+    codes = np.asarray(codes, dtype=np.uint8)
+    codes = np.concatenate([codes, np.zeros(-len(codes) % 4, dtype=np.uint8)]).reshape(-1, 4)
+    return (codes[:, 0] | codes[:, 1] << 2 | codes[:, 2] << 4 | codes[:, 3] << 6).astype(np.uint8)
+
+
+class Tablebase:
+    """Win/draw/loss and distance-to-end of canonical positions.
+
+    Positions are stored in one block per number of pieces. A bitmap over `rank`
+    marks which slots hold a legal canonical position, and those positions are
+    stored densely in rank order: WDL codes take 2 bits per position and distances
+    to end one byte. Each block is compressed with zlib and decompressed on first
+    probe, when the popcount of every SUPERBLOCK slots of the bitmap is computed
+    to map ranks to dense indices.
+    """
+
+    def __init__(self, nsquares=9):
+        self.nsquares = nsquares
+        self.map_blocks = {}
+        self.wdl_blocks = {}
+        self.dte_blocks = {}
+        self._blocks = {}
+
+    @classmethod
+    def from_minimax(cls, engine, min_pieces=0):
+        """Build tablebase from the evaluations of a MiniMax engine, keeping only
+        the layers with at least min_pieces.
+        """
+        nsquares = 9
+        tb = cls(nsquares)
+
+        layers = {}
+        for board_hash, evals in engine.board_evals.items():
+            board = tuple(board_hash // 3 ** i % 3 for i in range(nsquares))
+            npieces = sum(bool(sq) for sq in board)
+            if npieces < min_pieces:
+                continue
+
+            # MiniMax scores are -10 + nmoves for the losing side, and 0 for draws,
+            # which always end with a full board
+            score = evals.get('bestscore', evals.get('score'))
+            if score > 0:
+                entry = WIN, 10 - score - npieces
+            elif score < 0:
+                entry = LOSS, 10 + score - npieces
+            else:
+                entry = DRAW, nsquares - npieces
+            layers.setdefault(npieces, []).append((rank(board), *entry))
+
+        for npieces, entries in layers.items():
+            entries.sort()
+            bitmap = np.zeros(layer_size(nsquares, npieces), dtype=np.uint8)
+            bitmap[[index for index, _, _ in entries]] = 1
+            wdl = pack([code for _, code, _ in entries])
+            dte = np.array([dte for _, _, dte in entries], dtype=np.uint8)
+
+            tb.map_blocks[npieces] = zlib.compress(np.packbits(bitmap, bitorder='little').tobytes())
+            tb.wdl_blocks[npieces] = zlib.compress(wdl.tobytes())
+            tb.dte_blocks[npieces] = zlib.compress(dte.tobytes())
+
+        return tb
+
+    def _block(self, npieces):
+        if npieces not in self._blocks:
+            bitmap = zlib.decompress(self.map_blocks[npieces])
+            bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), bitorder='little')
+            bits = np.concatenate([bits, np.zeros(-len(bits) % SUPERBLOCK, dtype=np.uint8)])
+            counts = bits.reshape(-1, SUPERBLOCK).sum(axis=1)
+            prefix = [0] + np.cumsum(counts)[:-1].tolist()
+
+            self._blocks[npieces] = (
+                bitmap, prefix,
+                zlib.decompress(self.wdl_blocks[npieces]),
+                zlib.decompress(self.dte_blocks[npieces]),
+            )
+        return self._blocks[npieces]
+
+    def _dense_index(self, bitmap, prefix, index):
+        # Number of positions stored before slot index, or None if the slot is empty
+        byte, bit = index >> 3, index & 7
+        if not bitmap[byte] >> bit & 1:
+            return None
+
+        superblock = index // SUPERBLOCK
+        start = superblock * SUPERBLOCK >> 3
+        bits = int.from_bytes(bitmap[start:byte + 1], 'little')
+        bits &= (1 << ((byte - start) * 8 + bit)) - 1
+        return prefix[superblock] + bin(bits).count('1')
+
+    def probe(self, board: Board):
+        """Return (wdl, distance to end) of board, or None if it is not in the tablebase."""
+        board = canonical(board)
+        npieces = sum(bool(sq) for sq in board)
+        if npieces not in self.map_blocks:
+            return None
+
+        # Boards with the wrong piece split would alias a legal slot
+        if sum(sq == X for sq in board) != (npieces + 1) // 2:
+            return None
+
+        bitmap, prefix, wdl, dte = self._block(npieces)
+        index = self._dense_index(bitmap, prefix, rank(board))
+        if index is None:
+            return None
+        return wdl[index >> 2] >> 2 * (index & 3) & 3, dte[index]
+
+    def score(self, board: Board):
+        # Score of board from the point of view of the side to move, in MiniMax units
+        result = self.probe(board)
+        if result is None:
+            return None
+
+        code, dte = result
+        end_pieces = sum(bool(sq) for sq in board.board) + dte
+        if code == WIN:
+            return 10 - end_pieces
+        if code == LOSS:
+            return -10 + end_pieces
+        return 0
+
+    def layer(self, npieces):
+        # Iterate over (board, wdl, distance to end) of the positions with npieces
+        bitmap, _, wdl, dte = self._block(npieces)
+        bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), bitorder='little')
+        for index, slot in enumerate(np.flatnonzero(bits).tolist()):
+            code = wdl[index >> 2] >> 2 * (index & 3) & 3
+            yield Board(unrank(slot, self.nsquares, npieces)), code, dte[index]
+
+    def nbytes(self):
+        return sum(
+            len(block)
+            for blocks in (self.map_blocks, self.wdl_blocks, self.dte_blocks)
+            for block in blocks.values()
+        )
+
+    def save(self, path):
+        arrays = {}
+        for npieces in self.map_blocks:
+            arrays[f'map{npieces}'] = np.frombuffer(self.map_blocks[npieces], dtype=np.uint8)
+            arrays[f'wdl{npieces}'] = np.frombuffer(self.wdl_blocks[npieces], dtype=np.uint8)
+            arrays[f'dte{npieces}'] = np.frombuffer(self.dte_blocks[npieces], dtype=np.uint8)
+        np.savez(path, nsquares=self.nsquares, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        blocks = {'map': {}, 'wdl': {}, 'dte': {}}
+        with np.load(path) as data:
+            tb = cls(int(data['nsquares']))
+            for name in data.files:
+                if name[:3] in blocks:
+                    blocks[name[:3]][int(name[3:])] = data[name].tobytes()
+        tb.map_blocks = blocks['map']
+        tb.wdl_blocks = blocks['wdl']
+        tb.dte_blocks = blocks['dte']
+        return tb
+
+
+if __name__ == '__main__':
+    from minimax import MiniMax
+
+    engine = MiniMax()
+    engine.search()
+
+    tb = Tablebase.from_minimax(engine)
+    print('Positions:', len(engine.board_evals))
+    print('Compressed bytes:', tb.nbytes())
+
+    for npieces in sorted(tb.wdl_blocks):
+        codes = [code for _, code, _ in tb.layer(npieces)]
+        print(
+            f'{npieces=}:',
+            f'wins={codes.count(WIN)}',
+            f'draws={codes.count(DRAW)}',
+            f'losses={codes.count(LOSS)}',
+        )
+
+    # Use endgame tablebase as leaf oracle
+    engine = MiniMax(tablebase=Tablebase.from_minimax(engine, min_pieces=5))
+    print(engine.search())
+    print(len(engine.board_evals))
+    print(engine.tablebase_hits)